@@ -413,7 +413,7 @@ def estimate_download_size(runtime_dir: Path, update_url: str,
 
         seed = get_active_slot_index()
 
-    return get_update_size(seed, update_index)
+    return get_update_size(seed, update_index) or 0
 
 
 def ensure_estimated_download_size(update_path: UpdatePath,
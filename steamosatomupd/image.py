@@ -24,8 +24,10 @@ import datetime
 import logging
 import platform
 import re
+import sys
 import urllib.parse
 from dataclasses import dataclass, asdict
+from functools import cached_property
 from typing import Any
 
 import semantic_version
@@ -176,6 +178,13 @@ class Image:
         if arch == 'x86_64':
             arch = 'amd64'
 
+        # Only a handful of distinct values exist for these fields across an image pool,
+        # intern them so that all the images share the same string objects. The values come
+        # from the manifests, so anything that is not a string is kept as is, like before.
+        product, release, variant, branch, default_update_branch, arch = (
+            sys.intern(v) if isinstance(v, str) else v
+            for v in (product, release, variant, branch, default_update_branch, arch))
+
         # Return an instance
         return cls(product, release, variant, branch, default_update_branch, arch, version, buildid,
                    introduces_checkpoint, requires_checkpoint, shadow_checkpoint, estimated_size, skip, legacy_variant)
@@ -433,14 +442,30 @@ class Image:
 
         return not self.version
 
-    def is_stable(self) -> bool:
-        """Whether an Image is stable (i.e. it has a stable version)"""
+    # The version, release, buildid and checkpoint fields are never changed after an
+    # image has been created, so we can compute these values only once. They are queried
+    # for every candidate when looking for updates.
 
+    @cached_property
+    def _stable(self) -> bool:
         if self.version:
             return not self.version.prerelease
 
         return False
 
+    @cached_property
+    def _image_checkpoint(self) -> int:
+        return max(self.requires_checkpoint, self.introduces_checkpoint)
+
+    @cached_property
+    def _unique_name(self) -> str:
+        return f"{self.get_version_str()}_{self.release}_{self.buildid}"
+
+    def is_stable(self) -> bool:
+        """Whether an Image is stable (i.e. it has a stable version)"""
+
+        return self._stable
+
     def is_checkpoint(self) -> bool:
         """Whether this image introduces a new checkpoint"""
 
@@ -449,12 +474,12 @@ class Image:
     def get_image_checkpoint(self) -> int:
         """Returns the checkpoint number that this image will require for the
         subsequent updates"""
-        return max(self.requires_checkpoint, self.introduces_checkpoint)
+        return self._image_checkpoint
 
     def get_unique_name(self) -> str:
         """Generates a string that is unique for this image"""
 
-        return f"{self.get_version_str()}_{self.release}_{self.buildid}"
+        return self._unique_name
 
     def should_be_skipped(self) -> bool:
         """Whether the image should be skipped and not be considered as a valid update"""
@@ -477,14 +502,26 @@ class Image:
     # we simply use the release and buildid values. This allows us to mix
     # snapshot and versioned images. This is useful, for example, when we want
     # to allow older snaphot images to update to newer versioned images.
+    #
+    # The comparison keys are computed only once, because images are compared
+    # over and over again when sorting and filtering the update candidates.
+    # The build ID is stored as a plain tuple, to avoid going through the
+    # BuildId comparison methods.
+
+    @cached_property
+    def _cmp_key(self) -> tuple[Any, ...]:
+        return (self.version, self.release, (self.buildid.date, self.buildid.incr))
+
+    @cached_property
+    def _cmp_key_unversioned(self) -> tuple[Any, ...]:
+        return (self.release, (self.buildid.date, self.buildid.incr))
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Image):
             return NotImplemented
         if self.version and other.version:
-            return (self.version, self.release, self.buildid) == (
-                other.version, other.release, other.buildid)
-        return (self.release, self.buildid) == (other.release, other.buildid)
+            return self._cmp_key == other._cmp_key
+        return self._cmp_key_unversioned == other._cmp_key_unversioned
 
     def __ne__(self, other: object) -> bool:
         if not isinstance(other, Image):
@@ -493,27 +530,23 @@ class Image:
 
     def __lt__(self, other: Image) -> bool:
         if self.version and other.version:
-            return (self.version, self.release, self.buildid) < (
-                other.version, other.release, other.buildid)
-        return (self.release, self.buildid) < (other.release, other.buildid)
+            return self._cmp_key < other._cmp_key
+        return self._cmp_key_unversioned < other._cmp_key_unversioned
 
     def __le__(self, other: Image) -> bool:
         if self.version and other.version:
-            return (self.version, self.release, self.buildid) <= (
-                other.version, other.release, other.buildid)
-        return (self.release, self.buildid) <= (other.release, other.buildid)
+            return self._cmp_key <= other._cmp_key
+        return self._cmp_key_unversioned <= other._cmp_key_unversioned
 
     def __gt__(self, other: Image) -> bool:
         if self.version and other.version:
-            return (self.version, self.release, self.buildid) > (
-                other.version, other.release, other.buildid)
-        return (self.release, self.buildid) > (other.release, other.buildid)
+            return self._cmp_key > other._cmp_key
+        return self._cmp_key_unversioned > other._cmp_key_unversioned
 
     def __ge__(self, other: Image) -> bool:
         if self.version and other.version:
-            return (self.version, self.release, self.buildid) >= (
-                other.version, other.release, other.buildid)
-        return (self.release, self.buildid) >= (other.release, other.buildid)
+            return self._cmp_key >= other._cmp_key
+        return self._cmp_key_unversioned >= other._cmp_key_unversioned
 
     def __repr__(self) -> str:
         return "{{ {}, {}, {}, {}, {}, {}, {}, {}, {}, {} }}".format(
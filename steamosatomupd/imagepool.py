@@ -16,7 +16,12 @@
 # License along with this package.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+# Needed until PEP 563 string-based annotations is not enabled by default
+# (scheduled for Python 3.13)
+from __future__ import annotations
+
 import errno
+import itertools
 import json
 import logging
 import os
@@ -26,9 +31,11 @@ import sys
 import tempfile
 import weakref
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
-from copy import deepcopy, copy
+from copy import copy
 from pathlib import Path
+from typing import Any, Iterator
 
 from steamosatomupd.image import Image
 from steamosatomupd.update import UpdateCandidate, UpdatePath, UpdateType
@@ -44,20 +51,128 @@ RAUC_BUNDLE_EXT = '.raucb'
 CASYNC_STORE_EXT = '.castr'
 CHUNKS_DETAILS_EXT = '.chunks_details.json'
 
+# The (inode, mtime, ctime, size) stamp of a manifest file, and its decoded content
+_ParsedManifest = tuple[tuple[int, int, int, int], dict[str, Any]]
+
+
+def _get_rauc_update_path(images_dir: str, manifest_path: str, siblings: dict[str, os.DirEntry]) -> str:
+    """Get the RAUC bundle path, relative to the images directory, for a manifest
+
+    `siblings` is the listing of the directory that contains the manifest, keyed
+    by entry name. It lets us check the bundle and casync store presence with
+    the stats that `os.scandir` already cached, instead of issuing new syscalls.
+    """
+
+    manifest_dir, manifest_name = os.path.split(manifest_path)
+    base_name = manifest_name[:-len(IMAGE_MANIFEST_EXT)]
+
+    rauc_bundle = siblings.get(base_name + RAUC_BUNDLE_EXT)
+    if not rauc_bundle or not rauc_bundle.is_file():
+        rauc_bundle_path = os.path.join(manifest_dir, base_name + RAUC_BUNDLE_EXT)
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), rauc_bundle_path)
+
+    casync_store = siblings.get(base_name + CASYNC_STORE_EXT)
+    if not casync_store or not casync_store.is_dir():
+        casync_store_path = os.path.join(manifest_dir, base_name + CASYNC_STORE_EXT)
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), casync_store_path)
+
+    # The entries come from walking `images_dir`, so we usually just need to strip it
+    images_dir_prefix = os.path.join(images_dir, '')
+    if rauc_bundle.path.startswith(images_dir_prefix):
+        return rauc_bundle.path[len(images_dir_prefix):]
+
+    return os.path.relpath(rauc_bundle.path, images_dir)
+
+
+def _scan_directory(directory: str) -> tuple[dict[str, os.DirEntry], list[str], list[str]]:
+    """List a directory of the image hierarchy
+
+    Return a tuple with the directory entries keyed by name, the sorted manifest
+    paths and the sorted subdirectories that should be traversed.
+    Hidden directories and casync stores are not traversed.
+    """
+
+    siblings: dict[str, os.DirEntry] = {}
+    subdirs: list[str] = []
+    manifests: list[str] = []
+
+    # Classify the entries in a single pass, and only sort the ones we are interested in,
+    # which are usually way less than the bundles and casync stores
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                siblings[name] = entry
+
+                # Check the names first, so that we don't even need the entry type for
+                # the casync stores and the hidden entries
+                if name.endswith(CASYNC_STORE_EXT):
+                    continue
+
+                if name.endswith(IMAGE_MANIFEST_EXT) and not entry.is_dir():
+                    manifests.append(entry.path)
+                elif not name.startswith('.') and entry.is_dir() and not entry.is_symlink():
+                    # Like `os.walk`, do not follow symlinks to directories
+                    subdirs.append(entry.path)
+    except OSError as e:
+        # Like `os.walk`, skip the directories that can't be listed
+        log.debug("Unable to list %s: %s", directory, e)
+        return {}, [], []
+
+    manifests.sort()
+    subdirs.sort()
 
-def _get_rauc_update_path(images_dir: str, manifest_path: str) -> str:
+    return siblings, manifests, subdirs
 
-    rauc_bundle = manifest_path[:-len(IMAGE_MANIFEST_EXT)] + RAUC_BUNDLE_EXT
-    if not os.path.isfile(rauc_bundle):
-        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), rauc_bundle)
 
-    casync_store = manifest_path[:-len(IMAGE_MANIFEST_EXT)] + CASYNC_STORE_EXT
-    if not os.path.isdir(casync_store):
-        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), casync_store)
+def _iter_manifests(images_dir: str) -> Iterator[tuple[str, dict[str, os.DirEntry]]]:
+    """Walk the image hierarchy looking for manifest files
 
-    rauc_bundle_relpath = os.path.relpath(rauc_bundle, images_dir)
+    Yield a tuple with the manifest path and the listing of its parent directory,
+    keyed by entry name. Directories are visited depth-first, with both directories
+    and files in sorted order, to get the same order on all systems.
+
+    The directories are listed by a pool of threads, ahead of the depth-first
+    visit, so that the listings of sibling directories can overlap.
+    """
+
+    with ThreadPoolExecutor() as executor:
+        scans = {images_dir: executor.submit(_scan_directory, images_dir)}
+        stack = [images_dir]
+        while stack:
+            siblings, manifests, subdirs = scans.pop(stack.pop()).result()
+
+            # Start listing the subdirectories right away, before they are visited
+            for subdir in subdirs:
+                scans[subdir] = executor.submit(_scan_directory, subdir)
+
+            for manifest in manifests:
+                yield manifest, siblings
+
+            # Push the subdirectories in reverse, so that they are popped in sorted order
+            stack.extend(reversed(subdirs))
+
+
+def _load_manifest(manifest_path: str, entry: os.DirEntry, cache: dict[str, _ParsedManifest]) -> _ParsedManifest:
+    """Load the JSON content of an image manifest
+
+    Return a tuple with the manifest (inode, mtime, ctime, size) stamp and its content.
+    If `cache` already has the manifest with the same stamp, the file is not read again.
+    The inode and ctime catch the manifests replaced, or rewritten, with their previous
+    mtime and size preserved.
+    """
+
+    st = entry.stat()
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+    cached = cache.get(manifest_path)
+    if cached and cached[0] == stamp:
+        return cached
+
+    # Read the raw bytes in one go, `json.loads` detects the UTF encoding by itself
+    with open(manifest_path, 'rb') as m:
+        return stamp, json.loads(m.read())
 
-    return rauc_bundle_relpath
 
 # Image pool
 
@@ -72,27 +187,19 @@ def _get_update_candidates(candidates: list[UpdateCandidate], image: Image,
     - images that are either a checkpoint, either the latest image
     """
 
-    previous: UpdateCandidate | None = None
-    newest_candidate: UpdateCandidate | None = None
     winners: list[UpdateCandidate] = []
 
     if not candidates:
         return []
 
-    for candidate in reversed(candidates):
-        if candidate.image.shadow_checkpoint:
-            continue
-
-        if not newest_candidate:
-            newest_candidate = candidate
-        elif not previous:
-            previous = candidate
-            break
+    # Shadow checkpoints are not real images, so they can't be the newest candidate
+    non_shadow_candidates = (c for c in reversed(candidates) if not c.image.shadow_checkpoint)
+    newest_candidate: UpdateCandidate | None = next(non_shadow_candidates, None)
 
     if update_type == UpdateType.second_last:
         # If we are looking for the penultimate update, discard the newest image and
         # replace it with the "previous" ones
-        newest_candidate = previous
+        newest_candidate = next(non_shadow_candidates, None)
 
     if not newest_candidate:
         log.debug("There are no updates for %s/%s/%s",
@@ -110,23 +217,24 @@ def _get_update_candidates(candidates: list[UpdateCandidate], image: Image,
                       image.version, image.release, image.buildid)
             return []
 
-    # Keep only the candidates from the destination image, to avoid hopping between
+    # If the destination requires a newer checkpoint we add the necessary checkpoints to the winners list.
+    # Only consider the candidates from the destination image, to avoid hopping between
     # different variants and branches.
-    # Also remove any candidate that is newer than our chosen `newest_candidate`. We may encounter
+    # Also skip any candidate that is not older than our chosen `newest_candidate`. We may encounter
     # newer candidates when we are searching for the penultimate update or when there are shadow
-    # checkpoints.
-    filtered_candidates = [candidate for candidate in candidates if
-                           candidate.image.variant == newest_candidate.image.variant and
-                           candidate.image.branch == newest_candidate.image.branch and
-                           candidate.image < newest_candidate.image]
-
-    # If the destination requires a newer checkpoint we add the necessary checkpoints to the winners list
+    # checkpoints. We can't rely on their position in the sorted list for that, because
+    # versioned and snapshot images are not ordered in the same way.
+    newest_image = newest_candidate.image
+    newest_requires_checkpoint = newest_image.requires_checkpoint
     curr_checkpoint = image.get_image_checkpoint()
-    for candidate in filtered_candidates:
-        if not candidate.image.is_checkpoint():
+    for candidate in candidates:
+        # Check the checkpoint first, because most of the candidates are not checkpoints, and
+        # leave the more expensive image comparison for last
+        if (not candidate.image.is_checkpoint() or candidate.image.variant != newest_image.variant
+                or candidate.image.branch != newest_image.branch or not candidate.image < newest_image):
             continue
 
-        if curr_checkpoint == candidate.image.requires_checkpoint <= newest_candidate.image.requires_checkpoint:
+        if curr_checkpoint == candidate.image.requires_checkpoint <= newest_requires_checkpoint:
             if not candidate.image.shadow_checkpoint:
                 # Save this to the winners list only if it's not a shadow checkpoint.
                 # Otherwise, we simply keep track that we passed that checkpoint but do not propose
@@ -134,13 +242,13 @@ def _get_update_candidates(candidates: list[UpdateCandidate], image: Image,
                 winners.append(candidate)
             curr_checkpoint = candidate.image.introduces_checkpoint
 
-    if curr_checkpoint != newest_candidate.image.requires_checkpoint:
+    if curr_checkpoint != newest_requires_checkpoint:
         log.info("(%s) can't update to \"%s\"/\"%s\" because it is missing a required checkpoint",
                  image, newest_candidate.image.variant, newest_candidate.image.branch)
         return []
 
-    if newest_candidate not in winners:
-        winners.append(newest_candidate)
+    # The winners only come from the candidates older than `newest_candidate`, so it can't be there yet
+    winners.append(newest_candidate)
 
     if update_type.is_fallback():
         # If this is a fallback update, there is no need to do additional checks to avoid cycles.
@@ -148,15 +256,14 @@ def _get_update_candidates(candidates: list[UpdateCandidate], image: Image,
         # it means its original image is unexpected/broken/deprecated.
         return winners
 
-    for update in winners:
-        if update.image == image:
-            # If the same image version, release and buildid is available in multiple
-            # branches, we assume that they are exactly the same image and do not
-            # offer an update. Given that we don't know if a request is for an update,
-            # or for a branch switch, this could otherwise introduce an unexpected cycle.
-            log.info("Cycle detected, an update for %s/%s/%s can't be safely forced",
-                     image.version, image.release, image.buildid)
-            return []
+    if any(update.image == image for update in winners):
+        # If the same image version, release and buildid is available in multiple
+        # branches, we assume that they are exactly the same image and do not
+        # offer an update. Given that we don't know if a request is for an update,
+        # or for a branch switch, this could otherwise introduce an unexpected cycle.
+        log.info("Cycle detected, an update for %s/%s/%s can't be safely forced",
+                 image.version, image.release, image.buildid)
+        return []
 
     return winners
 
@@ -173,24 +280,22 @@ class ImagePool:
     instead UpdateCandidate objects, which are simply a wrapper above
     images, with an additional update_path attribute.
 
-    Internally, candidates are stored in the following structure:
+    Internally, candidates are stored in a flat dictionary, keyed by a
+    (product, arch, release, variant, branch) tuple:
 
     {
-      product1: {
-        arch: {
-          release1: {
-            variant1: [ CANDIDATE1, CANDIDATE2, ... ],
-            variant2: [ ... ]
-          },
-          release2: { ...
-          }, ...
-        }, ...
-      }, ...
+      (product1, arch1, release1, variant1, branch1): [ CANDIDATE1, CANDIDATE2, ... ],
+      (product1, arch1, release1, variant1, branch2): [ ... ],
+      ...
     }
 
+    When an image pool is created again for the same images directory, the
+    previous pool can be provided, to reuse the manifests that didn't change
+    in the meantime.
+
     """
 
-    def __init__(self, config):
+    def __init__(self, config, previous_pool: ImagePool | None = None):
         variants_eol = config.get('Images', 'VariantsEOL', fallback='').split()
         if config.has_section('Images.BranchesToConsider'):
             branches_to_consider = dict(config['Images.BranchesToConsider'])
@@ -212,7 +317,8 @@ class ImagePool:
                           config['Images']['Archs'].split(),
                           config['Images'].getboolean('StrictPoolValidation', True),
                           ri_variants,
-                          ri_branches)
+                          ri_branches,
+                          previous_pool)
 
     @classmethod
     def validate_config(cls, config: ConfigParser) -> None:
@@ -257,7 +363,8 @@ class ImagePool:
                      supported_releases: list[str], supported_variants: list[str], variants_eol: dict[str, str],
                      supported_branches: list[str], branches_to_consider: dict[str, str],
                      supported_archs: list[str], strict_pool_validation: bool,
-                     remote_info_variants: dict[str, list[str]], remote_info_branches: dict[str, list[str]]) -> None:
+                     remote_info_variants: dict[str, list[str]], remote_info_branches: dict[str, list[str]],
+                     previous_pool: ImagePool | None) -> None:
 
         # Make sure the images directory exists
         images_dir = os.path.abspath(images_dir)
@@ -274,8 +381,12 @@ class ImagePool:
         self.supported_branches = supported_branches
         self.supported_archs = supported_archs
         self.strict_pool_validation = strict_pool_validation
+        # All the supported (product, arch, release, variant, branch) combinations, which are
+        # the valid keys for the candidates dictionary
+        self.supported_keys = frozenset(itertools.product(supported_products, supported_archs, supported_releases,
+                                                          supported_variants, supported_branches))
         self.image_updates_found: list[UpdateCandidate] = []
-        self.extract_dir = tempfile.mkdtemp()
+        self.extract_dir = tempfile.mkdtemp(prefix='steamos-atomupd-')
 
         self.branches_to_consider: dict[str, list[str]] = {}
         for branch in branches_to_consider:
@@ -286,7 +397,15 @@ class ImagePool:
 
         self._finalizer = weakref.finalize(self, shutil.rmtree, self.extract_dir)
 
-        self.candidates: dict[str, list[UpdateCandidate]] = defaultdict(list)
+        self.candidates: dict[tuple[str, str, str, str, str], list[UpdateCandidate]] = defaultdict(list)
+        # The allowed candidates only depend on the candidate list key, and the static server asks
+        # for them multiple times for every image of a variant. The pool never changes after being
+        # created, so we can keep them around.
+        self._allowed_candidates: dict[tuple[str, str, str, str, str],
+                                       tuple[list[UpdateCandidate], list[UpdateCandidate]]] = {}
+        # The successful download size estimations, keyed by seed index, update index and chunks
+        # details (mtime, size). The same update is often proposed to an image for multiple branches.
+        self._update_sizes: dict[tuple[Path, Path, tuple[int, int] | None], int] = {}
 
         # Create a set to store all the images that we encounter. This is used to ensure we don't have
         # multiple images with the same version, release and buildid.
@@ -294,75 +413,83 @@ class ImagePool:
 
         # Populate the candidates dict
         log.debug("Walking the image tree: %s", images_dir)
-        for root, dirs, files in os.walk(images_dir):
-            # Sort dirs and files to get the same order on all systems.
-            dirs.sort()
-            files.sort()
-            dirs[:] = [d for d in dirs if not d.endswith(".castr")]
-            # Exclude hidden directories from the search
-            dirs[:] = [d for d in dirs if not d.startswith(".")]
-            for f in files:
-                # We're looking for manifest files
-                if not f.endswith(IMAGE_MANIFEST_EXT):
-                    continue
-
-                manifest_path = os.path.join(root, f)
-
-                # Create an image instance
-                try:
-                    with open(manifest_path, 'r', encoding='utf-8') as m:
-                        data = json.load(m)
-
-                    image = Image.from_dict(data)
-                except Exception as e:
-                    raise RuntimeError('Failed to create image from manifest %s' % f) from e
-
-                if image in images_found:
-                    raise RuntimeError("There are two images in the pool with the same version %s and buildid %s. "
-                                       "This is not allowed!" % (image.get_version_str(), image.buildid))
-
-                images_found.add(image)
-
-                if image.should_be_skipped():
-                    # This is an image that should not be an update candidate
-                    # Record it and then continue
-                    log.debug("Not considering %s as a valid update candidate", f)
-                    candidate = UpdateCandidate(image, "")
-                    self.image_updates_found.append(candidate)
-                    continue
-
-                # Get an update path for this image
-                try:
-                    if image.shadow_checkpoint:
-                        # Those are not real images, so we don't expect valid update paths
-                        update_path = ''
-                    else:
-                        update_path = _get_rauc_update_path(images_dir, manifest_path)
-                except Exception as e:
-                    raise RuntimeError("Failed to get update path for manifest %s" % f) from e
-
-                # Get the list where this image belongs
-                try:
-                    candidates = self._get_candidate_list(image)
-                except Exception as e:
-                    log.debug("Discarded unsupported image %s: %s", f, e)
-                    continue
-
-                # Discard unstable images if we don't want them
-                # TODO check the code to see if it's worth introducing image.is_unstable() for readability
-                if not want_unstable_images and not image.is_stable():
-                    log.debug("Discarded unstable image %s", f)
-                    continue
-
-                # Add image as an update candidate
-                candidate = UpdateCandidate(image, update_path)
+        manifests = list(_iter_manifests(images_dir))
+
+        # When running as a daemon, the pool is created again every time it gets updated, and
+        # usually only a few manifests changed in the meantime
+        previous_manifests: dict[str, _ParsedManifest] = {}
+        if previous_pool and previous_pool.images_dir == images_dir:
+            previous_manifests = previous_pool.manifests
+
+        # Read and parse the manifests concurrently. The eventual errors are kept in the
+        # futures and raised below, while we process the manifests in order.
+        with ThreadPoolExecutor() as executor:
+            manifests_data = [executor.submit(_load_manifest, path, siblings[os.path.basename(path)],
+                                              previous_manifests)
+                              for path, siblings in manifests]
+
+        # The parsed manifests, keyed by path, for the next time the pool is created
+        self.manifests: dict[str, _ParsedManifest] = {}
+        for (manifest_path, _), manifest_data in zip(manifests, manifests_data):
+            if not manifest_data.exception():
+                self.manifests[manifest_path] = manifest_data.result()
+
+        for (manifest_path, siblings), manifest_data in zip(manifests, manifests_data):
+            f = os.path.basename(manifest_path)
+
+            # Create an image instance
+            try:
+                _, data = manifest_data.result()
+                image = Image.from_dict(data)
+            except Exception as e:
+                raise RuntimeError('Failed to create image from manifest %s' % f) from e
+
+            if image in images_found:
+                raise RuntimeError("There are two images in the pool with the same version %s and buildid %s. "
+                                   "This is not allowed!" % (image.get_version_str(), image.buildid))
+
+            images_found.add(image)
+
+            if image.should_be_skipped():
+                # This is an image that should not be an update candidate
+                # Record it and then continue
+                log.debug("Not considering %s as a valid update candidate", f)
+                candidate = UpdateCandidate(image, "")
                 self.image_updates_found.append(candidate)
-                candidates.append(candidate)
-                log.debug("Update candidate added from manifest: %s", f)
+                continue
+
+            # Get an update path for this image
+            try:
+                if image.shadow_checkpoint:
+                    # Those are not real images, so we don't expect valid update paths
+                    update_path = ''
+                else:
+                    update_path = _get_rauc_update_path(images_dir, manifest_path, siblings)
+            except Exception as e:
+                raise RuntimeError("Failed to get update path for manifest %s" % f) from e
 
-        seen_intro: dict[str, list[int]] = defaultdict(list)
-        seen_shadow: dict[str, list[int]] = defaultdict(list)
-        seen_intro_skip: list[tuple[str, int]] = []
+            # Get the list where this image belongs
+            try:
+                candidates = self._get_candidate_list(image)
+            except Exception as e:
+                log.debug("Discarded unsupported image %s: %s", f, e)
+                continue
+
+            # Discard unstable images if we don't want them
+            # TODO check the code to see if it's worth introducing image.is_unstable() for readability
+            if not want_unstable_images and not image.is_stable():
+                log.debug("Discarded unstable image %s", f)
+                continue
+
+            # Add image as an update candidate
+            candidate = UpdateCandidate(image, update_path)
+            self.image_updates_found.append(candidate)
+            candidates.append(candidate)
+            log.debug("Update candidate added from manifest: %s", f)
+
+        seen_intro: dict[tuple[str, str], set[int]] = defaultdict(set)
+        seen_shadow: dict[tuple[str, str], set[int]] = defaultdict(set)
+        seen_intro_skip: set[tuple[tuple[str, str], int]] = set()
 
         # Validate the image pool
         for image_update in self.image_updates_found:
@@ -382,25 +509,28 @@ class ImagePool:
                                        f"you can simply remove its manifest.")
 
             if image.is_checkpoint():
+                variant_branch = (image.variant, image.branch)
                 if image.shadow_checkpoint:
-                    if image.introduces_checkpoint in seen_shadow[f'{image.variant}_{image.branch}']:
+                    if image.introduces_checkpoint in seen_shadow[variant_branch]:
                         raise RuntimeError(f"There are two shadow images for the same variant {image.variant}, "
                                            f"branch {image.branch} and checkpoint {image.introduces_checkpoint}!")
-                    seen_shadow[f'{image.variant}_{image.branch}'].append(image.introduces_checkpoint)
+                    seen_shadow[variant_branch].add(image.introduces_checkpoint)
                 elif not image.skip:
-                    if image.introduces_checkpoint in seen_intro[f'{image.variant}_{image.branch}']:
+                    if image.introduces_checkpoint in seen_intro[variant_branch]:
                         raise RuntimeError(f"There are two images for the same variant {image.variant}, "
                                            f"and branch {image.branch}, that introduce the same "
                                            f"checkpoint {image.introduces_checkpoint}!")
-                    seen_intro[f'{image.variant}_{image.branch}'].append(image.introduces_checkpoint)
+                    seen_intro[variant_branch].add(image.introduces_checkpoint)
                 else:
-                    seen_intro_skip.append((f'{image.variant}_{image.branch}', image.introduces_checkpoint))
+                    seen_intro_skip.add((variant_branch, image.introduces_checkpoint))
+
+        seen_intro_all = {(variant_branch, checkpoint) for variant_branch, checkpoints in seen_intro.items()
+                          for checkpoint in checkpoints}
 
-        for variant_branch, introduced_checkpoint in seen_intro_skip:
-            if introduced_checkpoint not in seen_intro[variant_branch]:
-                log.warning("The pool has a checkpoint for (%s, %s) marked as 'skip', but "
-                            "there isn't a canonical checkpoint to replace it.",
-                            variant_branch, introduced_checkpoint)
+        for variant_branch, introduced_checkpoint in sorted(seen_intro_skip - seen_intro_all):
+            log.warning("The pool has a checkpoint for (%s_%s, %s) marked as 'skip', but "
+                        "there isn't a canonical checkpoint to replace it.",
+                        *variant_branch, introduced_checkpoint)
 
     def __str__(self) -> str:
         return '\n'.join([
@@ -413,10 +543,18 @@ class ImagePool:
             'Branches  : {}'.format(self.supported_branches),
             'Branches order: {}'.format(self.branches_to_consider),
             'Archs     : {}'.format(self.supported_archs),
-            'Candidates: (see below)',
-            '{}'.format(pprint.pformat(self.candidates))
+            'Candidates: {} total'.format(sum(len(c) for c in self.candidates.values())),
         ])
 
+    def to_debug_string(self) -> str:
+        """Return the image pool description, followed by all its candidates
+
+        Formatting the candidates is expensive for big pools, only use it
+        for debugging purposes.
+        """
+
+        return '\n'.join([str(self), pprint.pformat(self.candidates)])
+
     def _get_candidate_list(self, image: Image, override_branch='') -> list[UpdateCandidate]:
         """Return the list of update candidates that an image belong to
 
@@ -427,16 +565,13 @@ class ImagePool:
         """
 
         branch = override_branch if override_branch else image.branch
+        key = (image.product, image.arch, image.release, image.variant, branch)
 
-        if (image.product not in self.supported_products
-                or image.arch not in self.supported_archs
-                or image.release not in self.supported_releases
-                or image.variant not in self.supported_variants
-                or branch not in self.supported_branches):
+        if key not in self.supported_keys:
             raise ValueError(f'Image ({image.product}, {image.arch}, {image.release}, {image.variant}, {branch}) '
                              'is not supported')
 
-        return self.candidates[f'{image.product}_{image.arch}_{image.release}_{image.variant}_{branch}']
+        return self.candidates[key]
 
     def get_all_allowed_candidates(self, image: Image,
                                    requested_branch: str) -> tuple[list[UpdateCandidate], list[UpdateCandidate]]:
@@ -447,8 +582,14 @@ class ImagePool:
         The two lists may differ when the server is configured to take into consideration more
         stable branches.
 
-        The returned lists are sorted in ascending order.
+        The returned lists are sorted in ascending order. They are shared between all the
+        images with the same product, arch, release and variant, so they must not be modified.
         """
+        key = (image.product, image.arch, image.release, image.variant, requested_branch)
+        cached = self._allowed_candidates.get(key)
+        if cached is not None:
+            return cached
+
         all_candidates: list[UpdateCandidate] = []
 
         # Take into consideration all the more stable branches too
@@ -471,11 +612,15 @@ class ImagePool:
                 # If the image with that branch is not supported try the next one
                 log.debug(err)
 
+        # Always sort the whole list in one go. The images are not totally ordered, because
+        # versioned and snapshot images are compared differently, so sorting the pool lists
+        # beforehand and merging them could give a different order.
         all_candidates.sort(key=lambda x: x.image)
 
         same_branch_candidates = [candidate for candidate in all_candidates if
                                   candidate.image.branch == requested_branch]
 
+        self._allowed_candidates[key] = (all_candidates, same_branch_candidates)
         return all_candidates, same_branch_candidates
 
     def get_updatepath(self, image: Image, relative_update_path: Path | None,
@@ -604,6 +749,38 @@ class ImagePool:
 
         return None
 
+    def _get_update_size(self, seed_index: Path, update_index: Path, chunks_details: Path) -> int:
+        """Get the download size of an update, reusing the previous successful estimations
+
+        The extracted indexes are never modified, while the chunks details are part of the
+        pool, so their modification time and size are part of the cache key. Failed
+        estimations are not cached, and are equal to zero.
+        """
+
+        chunks_details_stamp = None
+        if chunks_details.is_file():
+            st = chunks_details.stat()
+            chunks_details_stamp = (st.st_mtime_ns, st.st_size)
+
+        key = (seed_index, update_index, chunks_details_stamp)
+        size = self._update_sizes.get(key)
+        if size is not None:
+            return size
+
+        if chunks_details_stamp:
+            size = get_precise_update_size(seed_index, update_index, chunks_details)
+        else:
+            # TODO when we start to always include the chunks_details.json file for new images,
+            # we can stop doing this fallback estimated update size entirely
+            log.info("The download size is only an estimation because the chunks_details file is missing")
+            size = get_update_size(seed_index, update_index)
+
+        if size is None:
+            return 0
+
+        self._update_sizes[key] = size
+        return size
+
     def estimate_download_size(self, initial_image: Image, image_relative_path: Path,
                                update: UpdateCandidate) -> UpdateCandidate:
         """Estimate the download size for the update candidate image
@@ -612,7 +789,8 @@ class ImagePool:
         If the operation fails, the estimation will be equal to zero.
         """
 
-        update_copy = deepcopy(update)
+        # Only the image estimated size is going to change, a shallow copy of the image is enough
+        update_copy = UpdateCandidate(copy(update.image), update.update_path)
 
         initial_image_raucb = Path(self.images_dir) / image_relative_path
         initial_image_index = extract_index_from_raucb(initial_image_raucb, Path(self.extract_dir),
@@ -625,14 +803,8 @@ class ImagePool:
         chunks_details = update_raucb.with_suffix(CHUNKS_DETAILS_EXT)
 
         if initial_image_index and update_index:
-            if chunks_details.is_file():
-                update_copy.image.estimated_size = get_precise_update_size(initial_image_index, update_index,
-                                                                           chunks_details)
-            else:
-                # TODO when we start to always include the chunks_details.json file for new images,
-                # we can stop doing this fallback estimated update size entirely
-                log.info("The download size is only an estimation because the chunks_details file is missing")
-                update_copy.image.estimated_size = get_update_size(initial_image_index, update_index)
+            update_copy.image.estimated_size = self._get_update_size(initial_image_index, update_index,
+                                                                     chunks_details)
         else:
             # Estimating the download size is not a critical operation.
             # If it fails we try to continue anyway.
@@ -32,6 +32,7 @@ import signal
 import sys
 from difflib import ndiff
 from pathlib import Path
+from typing import Any
 
 import pyinotify # type: ignore
 
@@ -48,13 +49,20 @@ DEFAULT_SERVE_UNSTABLE = False
 TRIGGER_FILE = "updated.txt"
 # Please keep this in sync with atomupd-daemon
 REMOTE_INFO_FILE = "remote-info.conf"
+# Above this size, in characters, we don't log the differences of the replaced update JSONs
+# because ndiff can be quadratic
+MAX_LOGGED_DIFF_SIZE = 64 * 1024
+# The encoder for the update JSONs, which are pretty-printed with sorted keys
+UPDATE_JSON_ENCODER = json.JSONEncoder(sort_keys=True, indent=4)
 
 
 @contextlib.contextmanager
 def lockpathfile(filepath):
     """ Create a fcntl lock for the given file if possible."""
     with os.fdopen(
-        os.open(filepath, os.O_RDWR | os.O_CREAT | os.O_TRUNC, mode=0o666),
+        # Do not truncate the file when opening it, otherwise we would wipe the PID of the
+        # instance that is currently holding the lock
+        os.open(filepath, os.O_RDWR | os.O_CREAT, mode=0o666),
         mode="r+",
         buffering=1,
         encoding="utf-8",
@@ -66,6 +74,7 @@ def lockpathfile(filepath):
             yield False
             return
         pid = os.getpid()
+        f.truncate()
         f.write(f"{pid}\n")
         yield True
         fcntl.lockf(f, fcntl.LOCK_UN)
@@ -75,6 +84,19 @@ def lockpathfile(filepath):
             pass
 
 
+def _dump_update_json(update_dict: dict[str, Any]) -> str:
+    """Serialize an update dictionary as it is written in the update JSONs
+
+    Most of the update JSONs are empty because the image is already up to date,
+    so we don't bother calling the encoder for those.
+    """
+
+    if not update_dict:
+        return '{}'
+
+    return UPDATE_JSON_ENCODER.encode(update_dict)
+
+
 class UpdateParser(pyinotify.ProcessEvent):
     """Image pool with static update JSON files"""
 
@@ -88,10 +110,27 @@ class UpdateParser(pyinotify.ProcessEvent):
 
     def process_file_event(self, event):
         """Helper method to call from both create and attrib events"""
-        if os.path.basename(event.pathname) == TRIGGER_FILE:
+        # The events come from watching directories, so `name` is already the
+        # basename of the file that triggered them
+        if event.name == TRIGGER_FILE:
+            # Creating the trigger file, e.g. with `touch`, usually emits both IN_CREATE and
+            # IN_ATTRIB. Only parse the pool once per version of the trigger file.
+            try:
+                st = os.stat(event.pathname)
+            except OSError as e:
+                log.warning("Unable to stat the trigger %s: %s", event.pathname, e)
+                return
+
+            stamp = (st.st_ino, st.st_mtime_ns)
+            if self._trigger_stamps.get(event.pathname) == stamp:
+                log.debug("Trigger %s already handled, skipping...", event.pathname)
+                return
+
+            self._trigger_stamps[event.pathname] = stamp
+
             log.info("Trigger created: %s", event.pathname)
             # Run another parse
-            self.image_pool = ImagePool(self.config)
+            self.image_pool = ImagePool(self.config, self.image_pool)
             exit_code = self.parse_all()
 
             if exit_code != 0:
@@ -116,6 +155,9 @@ class UpdateParser(pyinotify.ProcessEvent):
     def __init__(self, args=None):
         super().__init__()
 
+        # The (inode, mtime) of the trigger files we already handled, keyed by path
+        self._trigger_stamps: dict[str, tuple[int, int]] = {}
+
         # Arguments
 
         parser = argparse.ArgumentParser(description="SteamOS Update Server")
@@ -160,12 +202,18 @@ class UpdateParser(pyinotify.ProcessEvent):
         self.image_pool = image_pool
         log.info("--- Image Pool ---")
         log.info(self.image_pool)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(self.image_pool.to_debug_string())
         log.info("------------------")
 
     def _write_update_json(self, image_update: UpdateCandidate, requested_branch: str,
-                           json_path: Path, update_jsons: set[Path],
+                           json_path: Path, update_jsons: set[Path], created_dirs: set[Path],
                            update_type=UpdateType.standard, estimate_download_size=False) -> None:
-        """Get the available updates and write them in a JSON"""
+        """Get the available updates and write them in a JSON
+
+        The parent directories that get created are added to `created_dirs`, so that
+        we don't try to create them again for the next JSON files.
+        """
 
         image = image_update.image
         update_path = Path(image_update.update_path)
@@ -179,53 +227,70 @@ class UpdateParser(pyinotify.ProcessEvent):
         update = self.image_pool.get_updates(image, update_path, requested_branch, update_type, False)
         update_dict = update.to_dict() if update else {}
 
-        old_lines: list[str] = []
+        old_text = ''
+        update_json = ''
 
         if json_path.is_file():
             with open(json_path, 'r', encoding='utf-8') as old:
-                old_data = json.load(old)
-                if old_data:
-                    # Compare the existing (old) data with the new update
-                    # In order to do the comparison we need to filter out the estimated download size,
-                    # because at this stage we didn't calculate it yet.
-                    try:
-                        old_update = UpdatePath.from_dict(old_data)
-                        for candidate in old_update.candidates:
-                            candidate.image.estimated_size = 0
-
-                        old_data = old_update.to_dict()
-                    except KeyError as e:
-                        # If we can't parse the existing (old) json data, we log a warning and
-                        # just replace it with the new data
-                        log.warning('Unable to parse old update data %s: %s', json_path, e)
-
-                if old_data == update_dict:
+                old_text = old.read()
+
+            if not estimate_download_size:
+                # Without a download size estimation, an unchanged JSON is byte for byte identical
+                # to what we would write, and a string comparison is way cheaper than parsing it back
+                update_json = _dump_update_json(update_dict)
+                if old_text == update_json:
                     log.debug('"%s" has not changed, skipping...', json_path)
                     return
 
-                if log.level <= logging.INFO:
-                    old.seek(0)
-                    old_lines = old.readlines()
-        else:
+            old_data = json.loads(old_text)
+            if old_data:
+                # Compare the existing (old) data with the new update
+                # In order to do the comparison we need to filter out the estimated download size,
+                # because at this stage we didn't calculate it yet.
+                try:
+                    old_update = UpdatePath.from_dict(old_data)
+                    for candidate in old_update.candidates:
+                        candidate.image.estimated_size = 0
+
+                    old_data = old_update.to_dict()
+                except KeyError as e:
+                    # If we can't parse the existing (old) json data, we log a warning and
+                    # just replace it with the new data
+                    log.warning('Unable to parse old update data %s: %s', json_path, e)
+
+            if old_data == update_dict:
+                log.debug('"%s" has not changed, skipping...', json_path)
+                return
+        elif json_path.parent not in created_dirs:
             json_path.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(json_path.parent)
 
-        if estimate_download_size:
-            # If we need to estimate the download size, re-get the available updates with that option enabled
-            update = self.image_pool.get_updates(image, update_path, requested_branch, update_type,
-                                                 estimate_download_size)
-            update_dict = update.to_dict() if update else {}
+        if estimate_download_size and update:
+            # Now that we know the JSON needs to be written, estimate the download size. Like
+            # `ImagePool.get_updatepath()`, we only estimate the size of the first update.
+            update.candidates[0] = self.image_pool.estimate_download_size(image, update_path, update.candidates[0])
+            update_dict = update.to_dict()
+            update_json = ''
 
-        update_json = json.dumps(update_dict, sort_keys=True, indent=4)
+        if not update_json:
+            update_json = _dump_update_json(update_dict)
 
-        if old_lines:
+        if old_text and log.isEnabledFor(logging.INFO):
             # We have this only if the old JSON file changed, and also the logging level is at least INFO
-            new_lines = update_json.splitlines(keepends=True)
-            ndiff_out = ndiff(old_lines, new_lines)
-            differences = [li for li in ndiff_out if li[0] != ' ']
-            log.info('Replacing "%s":\n%s', json_path, ''.join(differences))
-
-        with open(json_path, 'w', encoding='utf-8') as file:
+            if max(len(old_text), len(update_json)) > MAX_LOGGED_DIFF_SIZE:
+                log.info('Replacing "%s" (%d -> %d characters)', json_path, len(old_text), len(update_json))
+            else:
+                old_lines = old_text.splitlines(keepends=True)
+                new_lines = update_json.splitlines(keepends=True)
+                differences = [li for li in ndiff(old_lines, new_lines) if li[0] != ' ']
+                log.info('Replacing "%s":\n%s', json_path, ''.join(differences))
+
+        # Write to a temporary file first and then rename it, so that the clients never
+        # download a partially written JSON
+        tmp_path = json_path.with_name(f'.{json_path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
             file.write(update_json)
+        os.replace(tmp_path, json_path)
 
     def _write_remote_info_config(self, remote_info_written: set[Path], image: Image):
         remote_info = Path(image.get_update_path(fallback=True)).parent / REMOTE_INFO_FILE
@@ -269,20 +334,19 @@ class UpdateParser(pyinotify.ProcessEvent):
         handled by this static server instance.
         """
 
-        evaluated_directories: set[Path] = set()
-
+        # The names of the update JSONs we expect, grouped by directory
+        expected_names: dict[Path, set[str]] = {}
         for update_json in update_jsons:
-            if update_json.parent in evaluated_directories:
-                continue
-
-            evaluated_directories.add(update_json.parent)
+            expected_names.setdefault(update_json.parent, set()).add(update_json.name)
 
-            for file in update_json.parent.glob('*.json'):
-                if file in update_jsons:
-                    continue
-                log.warning('"%s" is likely a leftover, probably from a removed image!\n'
-                            'This should be either manually removed (is that what you want?) or the deleted '
-                            'image\'s JSON manifest should be reinstated with the "skip" option set', file)
+        for directory, names in expected_names.items():
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json') or entry.name in names:
+                        continue
+                    log.warning('"%s" is likely a leftover, probably from a removed image!\n'
+                                'This should be either manually removed (is that what you want?) or the deleted '
+                                'image\'s JSON manifest should be reinstated with the "skip" option set', entry.path)
 
     def paths_to_watch(self) -> list[str]:
         """Get paths to watch based on the pool_dir subdirectories"""
@@ -292,11 +356,13 @@ class UpdateParser(pyinotify.ProcessEvent):
         pool_dir = self.image_pool.images_dir
         log.info("Watching subdirectories of %s", pool_dir)
 
-        for file in os.listdir(pool_dir):
-            d = os.path.join(pool_dir, file)
-            if os.path.isdir(d):
-                log.info("Watching %s", d)
-                ret_list.append(d)
+        # Like `os.path.isdir()`, `is_dir()` follows symlinks, but it usually doesn't
+        # need an additional stat for that
+        with os.scandir(pool_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    log.info("Watching %s", entry.path)
+                    ret_list.append(entry.path)
 
         return ret_list
 
@@ -315,6 +381,8 @@ class UpdateParser(pyinotify.ProcessEvent):
         second_last_update_jsons: set[Path] = set()
         # List of remote-info.conf file that have been already written
         remote_info_written: set[Path] = set()
+        # Directories of the update JSONs that we already created
+        created_dirs: set[Path] = set()
 
         # Number of images for which we should pre-estimate the download size.
         # This is an arbitrary number chosen to be not big enough to slow down the static
@@ -356,14 +424,14 @@ class UpdateParser(pyinotify.ProcessEvent):
                          requested_branch)
 
                 self._write_update_json(image_update, requested_branch, json_path, update_jsons,
-                                        UpdateType.standard, estimate_download_size)
+                                        created_dirs, UpdateType.standard, estimate_download_size)
 
                 # Skip the download size estimation for the generic fallbacks, because we have no
                 # way of knowing what's the base image the client is using.
                 self._write_update_json(image_update, requested_branch, json_path_fallback,
-                                        fallback_update_jsons, UpdateType.unexpected_buildid)
+                                        fallback_update_jsons, created_dirs, UpdateType.unexpected_buildid)
                 self._write_update_json(image_update, requested_branch, json_path_second_last,
-                                        second_last_update_jsons, UpdateType.second_last)
+                                        second_last_update_jsons, created_dirs, UpdateType.second_last)
 
         # Pass the canonical update JSONs, because we want to check for leftovers only inside
         # the `/product/arch/version/variant` directories we are actually handling with this
@@ -32,7 +32,7 @@ ROOTFS_INDEX = Path('rootfs.img.caibx')
 COMPRESSION_RATIO = 1.33
 
 
-def get_precise_update_size(seed_index: Path, update_index: Path, chunks_details: Path) -> int:
+def get_precise_update_size(seed_index: Path, update_index: Path, chunks_details: Path) -> int | None:
     """Get the precise update download size
 
     If we have the chunks details JSON file, we know exactly what's the size of
@@ -40,7 +40,7 @@ def get_precise_update_size(seed_index: Path, update_index: Path, chunks_details
     estimation, and we can instead precisely know how much data needs to be
     downloaded.
 
-    Returns the precise update download size in Bytes or zero if an error occurs.
+    Returns the precise update download size in Bytes or None if an error occurs.
     """
 
     info = subprocess.run(['desync', 'info',
@@ -54,16 +54,16 @@ def get_precise_update_size(seed_index: Path, update_index: Path, chunks_details
     if info.returncode != 0:
         log.warning("Failed to gather information about the update: %i: %s",
                     info.returncode, info.stdout)
-        return 0
+        return None
 
     index_info = json.loads(info.stdout)
     return index_info.get("dedup-size-not-in-seed-nor-cache-compressed", 0)
 
 
-def get_update_size(seed_index: Path, update_index: Path) -> int:
+def get_update_size(seed_index: Path, update_index: Path) -> int | None:
     """Get the estimated update download size
 
-    Returns the estimated size in Bytes or zero if we were not able to estimate
+    Returns the estimated size in Bytes or None if we were not able to estimate
     the download size.
     """
 
@@ -75,7 +75,7 @@ def get_update_size(seed_index: Path, update_index: Path) -> int:
     if info.returncode != 0:
         log.warning("Failed to gather information about the update: %i: %s",
                     info.returncode, info.stdout)
-        return 0
+        return None
 
     index_info = json.loads(info.stdout)
     dedup_size = index_info.get("dedup-size-not-in-seed", 0)
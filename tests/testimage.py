@@ -184,6 +184,16 @@ class MiscTestCase(unittest.TestCase):
         self.assertEqual(image.estimated_size, 12312345)
         self.assertFalse(image.skip)
 
+    def test_non_string_args(self):
+        d = dict(imgdata)
+
+        # Nothing in a JSON manifest prevents these values from being something else than
+        # a string, they are kept as they are.
+        d['release'] = 2024
+
+        image = Image.from_dict(d)
+        self.assertEqual(image.release, 2024)
+
 
 @dataclass
 class ImageData:
@@ -16,10 +16,16 @@
 # License along with this package.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import configparser
+import json
+import os
+import tempfile
 import unittest
+from pathlib import Path
+from unittest.mock import patch
 
 from steamosatomupd.image import Image
-from steamosatomupd.imagepool import _get_update_candidates
+from steamosatomupd.imagepool import ImagePool, _get_update_candidates, _iter_manifests
 from steamosatomupd.update import UpdateCandidate, UpdateType
 
 imgdata = {
@@ -76,5 +82,151 @@ class GetUpdateCandidatesTestCase(unittest.TestCase):
         res = _get_update_candidates([ c1, c2, c3 ], i, UpdateType.standard)
         self.assertTrue(res == [])
 
+    def test_get_update_candidates_mixed_snapshots(self):
+        d  = dict(imgdata)
+        d1 = dict(imgdata)
+        d2 = dict(imgdata)
+        d3 = dict(imgdata)
+        d4 = dict(imgdata)
+
+        d['version']  = '3.1'
+        d['buildid']  = '20230104.1'
+        # A snapshot checkpoint: it sorts before the versioned images with a newer buildid,
+        # but it's newer than the 3.3 image, because snapshots are compared by buildid
+        d1['version'] = 'snapshot'
+        d1['buildid'] = '20230102.1'
+        d1['introduces_checkpoint'] = 1
+        d2['version'] = '3.2'
+        d2['buildid'] = '20230108.1'
+        d3['version'] = '3.3'
+        d3['buildid'] = '20230101.1'
+        d4['version'] = '3.4'
+        d4['buildid'] = '20230109.1'
+
+        i  = mk_image(d)
+        c1 = mk_update_candidate(d1)
+        c2 = mk_update_candidate(d2)
+        c3 = mk_update_candidate(d3)
+        c4 = mk_update_candidate(d4)
+
+        candidates = sorted([ c4, c3, c2, c1 ], key=lambda x: x.image)
+        self.assertEqual(candidates, [ c1, c2, c3, c4 ])
+
+        # the snapshot checkpoint is not older than the destination, so it must not be
+        # proposed, nor required, even if it comes first in the sorted list
+        res = _get_update_candidates(candidates[:3], i, UpdateType.unexpected_buildid)
+        self.assertEqual(res, [ c3 ])
+
+        res = _get_update_candidates(candidates, i, UpdateType.second_last)
+        self.assertEqual(res, [ c3 ])
+
+class IterManifestsTestCase(unittest.TestCase):
+
+    def test_iter_manifests(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            files = [
+                'b/2.manifest.json',
+                'b/1.manifest.json',
+                'b/1.raucb',
+                'a/c/3.manifest.json',
+                'a/0.manifest.json',
+                'z.manifest.json',
+                '.hidden/4.manifest.json',
+                'a/1.castr/5.manifest.json',
+            ]
+            for file in files:
+                (root / file).parent.mkdir(parents=True, exist_ok=True)
+                (root / file).touch()
+
+            manifests = [os.path.relpath(path, tmpdir) for path, _ in _iter_manifests(tmpdir)]
+
+            # Same order as a sorted `os.walk`, without hidden directories and casync stores
+            self.assertEqual(manifests, ['z.manifest.json',
+                                         'a/0.manifest.json',
+                                         'a/c/3.manifest.json',
+                                         'b/1.manifest.json',
+                                         'b/2.manifest.json'])
+
+            # The siblings contain the whole parent directory listing
+            siblings = dict(_iter_manifests(tmpdir))[str(root / 'b/1.manifest.json')]
+            self.assertEqual(sorted(siblings), ['1.manifest.json', '1.raucb', '2.manifest.json'])
+
+class ImagePoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.pool_dir = Path(tmpdir.name)
+
+    def mk_image_pool(self, previous_pool=None):
+        config = configparser.ConfigParser()
+        config['Images'] = {'PoolDir': str(self.pool_dir),
+                            'Unstable': 'True',
+                            'Products': 'steamos',
+                            'Releases': 'holo',
+                            'Variants': 'steamdeck',
+                            'Branches': 'stable',
+                            'Archs': 'amd64'}
+        return ImagePool(config, previous_pool)
+
+    def mk_image_files(self, imgdata):
+        base = self.pool_dir / f"steamos-holo-{imgdata['buildid']}-{imgdata['version']}-amd64-steamdeck"
+        manifest = base.with_name(base.name + '.manifest.json')
+        manifest.write_text(json.dumps(imgdata))
+        base.with_name(base.name + '.raucb').touch()
+        base.with_name(base.name + '.castr').mkdir()
+        return manifest
+
+    def test_reuse_previous_manifests(self):
+        d1 = dict(imgdata, release='holo', version='3.6.1', buildid='20231103.1')
+        d2 = dict(imgdata, release='holo', version='3.6.2', buildid='20231104.1')
+        manifest1 = self.mk_image_files(d1)
+        manifest2 = self.mk_image_files(d2)
+
+        pool = self.mk_image_pool()
+        self.assertEqual(sorted(str(c.image.buildid) for c in pool.get_image_updates_found()),
+                         ['20231103.1', '20231104.1'])
+
+        # Replace the first manifest, keeping the same mtime and size, like `rsync --times` would
+        st = manifest1.stat()
+        tmp_manifest = manifest1.with_name('.tmp')
+        tmp_manifest.write_text(json.dumps(dict(d1, buildid='20231103.2')))
+        os.utime(tmp_manifest, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_manifest, manifest1)
+        self.assertEqual(manifest1.stat().st_size, st.st_size)
+
+        new_pool = self.mk_image_pool(pool)
+        self.assertEqual(sorted(str(c.image.buildid) for c in new_pool.get_image_updates_found()),
+                         ['20231103.2', '20231104.1'])
+        # The unchanged manifest has not been parsed again
+        self.assertIs(new_pool.manifests[str(manifest2)], pool.manifests[str(manifest2)])
+
+    def test_get_update_size(self):
+        pool = self.mk_image_pool()
+        seed_index = Path('seed.caibx')
+        update_index = Path('update.caibx')
+        chunks_details = self.pool_dir / 'update.chunks_details.json'
+
+        with patch('steamosatomupd.imagepool.get_update_size', side_effect=[None, 1000]) as get_update_size:
+            # A failed estimation is tried again the next time
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 0)
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 1000)
+            # While a successful one is reused
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 1000)
+            self.assertEqual(get_update_size.call_count, 2)
+
+        chunks_details.write_text('{}')
+        with patch('steamosatomupd.imagepool.get_precise_update_size', side_effect=[None, 500, 600]) as get_size:
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 0)
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 500)
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 500)
+            self.assertEqual(get_size.call_count, 2)
+
+            # The chunks details are part of the pool, a modified file needs a new estimation
+            os.utime(chunks_details, ns=(1, 1))
+            self.assertEqual(pool._get_update_size(seed_index, update_index, chunks_details), 600)
+            self.assertEqual(get_size.call_count, 3)
+
 if __name__ == '__main__':
     unittest.main()
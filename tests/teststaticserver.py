@@ -30,6 +30,7 @@ import time
 import unittest
 from difflib import ndiff
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import patch
 
 from tests.createmanifests import build_image_hierarchy
@@ -828,6 +829,53 @@ class StaticServerTestCase(unittest.TestCase):
         images.cleanup()
 
 
+class TriggerFileTestCase(unittest.TestCase):
+
+    def test_trigger_file_events(self):
+        from steamosatomupd import staticserver
+
+        with (
+            tempfile.TemporaryDirectory() as pool_dir,
+            tempfile.TemporaryDirectory() as meta_dir,
+            tempfile.NamedTemporaryFile(mode='w', buffering=1) as tmp_config,
+            cm_chdir(meta_dir)
+        ):
+            config = configparser.RawConfigParser()
+            config['Images'] = {'PoolDir': pool_dir,
+                                'Unstable': 'True',
+                                'Products': 'steamos',
+                                'Releases': 'holo',
+                                'Variants': 'steamdeck',
+                                'Branches': 'stable',
+                                'Archs': 'amd64'}
+            config.write(tmp_config)
+
+            server = staticserver.UpdateParser(['--config', tmp_config.name])
+
+            trigger = Path(pool_dir) / 'steamos' / 'updated.txt'
+            trigger.parent.mkdir()
+            trigger.touch()
+            # The pool subdirectories are watched, so the event name is the trigger basename
+            event = SimpleNamespace(name=trigger.name, pathname=str(trigger))
+
+            with patch.object(server, 'parse_all', return_value=0) as parse_all:
+                # Creating the trigger with `touch` emits both IN_CREATE and IN_ATTRIB
+                server.process_IN_CREATE(event)
+                server.process_IN_ATTRIB(event)
+                self.assertEqual(parse_all.call_count, 1)
+                self.assertTrue((Path(meta_dir) / 'steamos-updated.txt').is_file())
+
+                # Touching the trigger again changes its mtime, and starts a new parse
+                os.utime(trigger, ns=(1, 1))
+                server.process_IN_ATTRIB(event)
+                self.assertEqual(parse_all.call_count, 2)
+
+                # Events for other files are ignored
+                server.process_IN_CREATE(SimpleNamespace(name='other.txt',
+                                                         pathname=str(trigger.with_name('other.txt'))))
+                self.assertEqual(parse_all.call_count, 2)
+
+
 if __name__ == '__main__':
     # Run static server on test config
     # Compare output with expected results